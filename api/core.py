@@ -3,13 +3,23 @@ import sys
 import io
 import time
 import json
+import mmap
+import queue
 import asyncio
 import subprocess
 import platform
 import shutil
+import threading
+from functools import lru_cache
 from typing import NamedTuple, Optional, Dict, List
 from dataclasses import dataclass
 
+try:
+    import orjson
+    def json_line(obj) -> bytes: return orjson.dumps(obj) + b"\n"
+except ImportError:
+    def json_line(obj) -> bytes: return (json.dumps(obj) + "\n").encode()
+
 # ========================================================
 # SYSTEM & PATHS
 # ========================================================
@@ -27,6 +37,31 @@ paths = {
     "build_index": os.path.join(project_root, "build_fs.index")
 }
 
+def _chmod_x(root):
+    # In-process replacement for `chmod -R +x`: no shell, no fork+exec on
+    # the cold path, and already-executable files are left untouched.
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for e in entries:
+                    try:
+                        if e.is_dir(follow_symlinks=False): stack.append(e.path)
+                        mode = e.stat(follow_symlinks=False).st_mode
+                        if mode & 0o111 != 0o111: os.chmod(e.path, mode | 0o111)
+                    except OSError: continue
+        except OSError: continue
+
+@lru_cache(maxsize=1)
+def ensure_bin_executable():
+    # Lazy counterpart to setup_environment: only the first request that
+    # may exec a bundled binary (the shell endpoint) pays the permission
+    # walk, instead of every cold start on every route.
+    if os.path.exists(paths["bin"]):
+        try: _chmod_x(paths["bin"])
+        except: pass
+    return True
+
 def setup_environment():
     if os.path.exists(paths["vendor"]) and paths["vendor"] not in sys.path:
         sys.path.insert(0, paths["vendor"])
@@ -34,30 +69,46 @@ def setup_environment():
 
     if os.path.exists(paths["bin"]):
         os.environ["PATH"] = f"{paths['bin']}:{os.environ.get('PATH', '')}"
-        try:
-            subprocess.run(f"chmod -R +x {paths['bin']}", shell=True, stderr=subprocess.DEVNULL)
-        except: pass
 
     if os.path.exists(paths["lib"]):
         os.environ["LD_LIBRARY_PATH"] = f"{paths['lib']}:{os.environ.get('LD_LIBRARY_PATH', '')}"
 
-BUILD_FS_CACHE: Dict[str, List[dict]] = {}
+# Slotted entries: the build index holds hundreds of thousands of rows,
+# and a per-entry dict costs several times more RAM than fixed slots.
+# FastAPI serializes dataclasses to the same JSON shape as the old dicts.
+@dataclass(frozen=True, slots=True)
+class FsEntry:
+    name: str
+    path: str
+    is_dir: bool
+    size: str
+    ext: str
+
+BUILD_FS_CACHE: Dict[str, List[FsEntry]] = {}
+
+def _ext(name):
+    # Cheaper than os.path.splitext for bare filenames: one rfind scan.
+    i = name.rfind('.')
+    return name[i:].lower() if i > 0 else ''
 
 def load_build_fs_cache():
     if not os.path.exists(paths["build_index"]): return
     try:
-        dir_stack = [] 
-        with open(paths["build_index"], 'r', encoding='utf-8') as f:
-            for line in f:
-                stripped = line.lstrip(' ')
+        dir_stack = []
+        # Map the index read-only and split on raw bytes: one pass, no
+        # text-mode decode per line (only entry names get decoded).
+        with open(paths["build_index"], 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            for raw in bytes(mm).splitlines():
+                stripped = raw.lstrip(b' ')
                 if not stripped: continue
-                content = stripped.rstrip('\n')
-                depth = len(line) - len(stripped)
+                content = stripped.decode('utf-8')
+                depth = len(raw) - len(stripped)
                 is_dir = content.endswith('/')
                 name = content.rstrip('/')
                 
                 if depth == 0:
-                    current_path = "/" if name == "" else name
+                    current_path = sys.intern("/" if name == "" else name)
                     dir_stack = [current_path]
                     if current_path not in BUILD_FS_CACHE: BUILD_FS_CACHE[current_path] = []
                     continue
@@ -65,18 +116,36 @@ def load_build_fs_cache():
                 while len(dir_stack) > depth: dir_stack.pop()
                 parent_path = dir_stack[-1]
                 abs_path = f"/{name}" if parent_path == "/" else f"{parent_path}/{name}"
+                # Directory paths recur as cache keys, stack entries and
+                # child-path prefixes; interning keeps one copy of each.
+                if is_dir: abs_path = sys.intern(abs_path)
                 
                 if parent_path not in BUILD_FS_CACHE: BUILD_FS_CACHE[parent_path] = []
-                BUILD_FS_CACHE[parent_path].append({
-                    "name": name, "path": abs_path, "is_dir": is_dir, "size": "-",
-                    "ext": os.path.splitext(name)[1].lower() if not is_dir else ""
-                })
+                BUILD_FS_CACHE[parent_path].append(FsEntry(
+                    name, abs_path, is_dir, "-",
+                    _ext(name) if not is_dir else ""
+                ))
                 
                 if is_dir:
                     dir_stack.append(abs_path)
                     if abs_path not in BUILD_FS_CACHE: BUILD_FS_CACHE[abs_path] = []
+            mm.close()
     except Exception as e: print(f"Error loading tree index: {e}")
 
+_build_fs_lock = threading.Lock()
+_build_fs_loaded = False
+
+def get_build_fs_cache() -> Dict[str, List[FsEntry]]:
+    # Lazy: only browsing the build snapshot pays the index parse, not
+    # every cold start. Double-checked since FastAPI serves from threads.
+    global _build_fs_loaded
+    if not _build_fs_loaded:
+        with _build_fs_lock:
+            if not _build_fs_loaded:
+                load_build_fs_cache()
+                _build_fs_loaded = True
+    return BUILD_FS_CACHE
+
 def get_human_size(size_bytes):
     if isinstance(size_bytes, str): return size_bytes
     for unit in ['B','KB','MB','GB']:
@@ -84,13 +153,25 @@ def get_human_size(size_bytes):
         size_bytes /= 1024
     return f"{size_bytes:.2f} TB"
 
+def get_dir_size(path):
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for e in entries:
+                    try:
+                        if e.is_dir(follow_symlinks=False): stack.append(e.path)
+                        else: total += e.stat(follow_symlinks=False).st_size
+                    except OSError: continue
+        except OSError: continue
+    return total
+
 def get_size_str(path):
     total = 0
     try:
         if os.path.isfile(path): total = os.path.getsize(path)
-        else:
-            res = subprocess.run(["du", "-sb", path], stdout=subprocess.PIPE, text=True)
-            total = int(res.stdout.split()[0])
+        else: total = get_dir_size(path)
     except: pass
     return get_human_size(total)
 
@@ -129,14 +210,14 @@ def get_python_inodes():
         except: pass
     return []
 
-load_build_fs_cache()
-
 # ========================================================
 # DATA STRUCTURES
 # ========================================================
 @dataclass(frozen=True)
 class Config:
     BUFFER_TAIL: int = 600 # 10 minutes buffer for "Old Approach"
+    UPLOAD_CONCURRENCY: int = 4 # Max simultaneous provider uploads
+    CONVEYOR_CAPACITY: int = 3 # Sealed boxes allowed in flight (caps RAM at ~capacity x box size)
 
 CONFIG = Config()
 CODEC_MAP = {"opus": "webm", "aac": "mp4", "mp3": "mp3", "vorbis": "ogg"}
@@ -155,17 +236,38 @@ class Cargo(NamedTuple):
     mime_type: str
     size_mb: float
 
-def log_dispatch(q: asyncio.Queue, ctx: SessionContext, event_type: str, payload: dict = None, text: str = None):
-    if not q: return
-    packet = { "type": event_type, "timestamp": time.time(), "payload": payload or {} }
+def render_log_event(ctx: SessionContext, event_type: str, payload: dict, text: str, ts: float) -> List[bytes]:
+    packet = { "type": event_type, "timestamp": ts, "payload": payload or {} }
     if text and "message" not in packet["payload"]: packet["payload"]["message"] = text
-    
+
     # Data Mode: Strict JSON, skip raw text logs
     if ctx.mode == "data":
-        if event_type in ["asset", "error", "keepalive"]: q.put_nowait(json.dumps(packet) + "\n")
+        return [json_line(packet)] if event_type in ["asset", "error", "keepalive"] else []
+
+    # Debug Mode: Verbose. Text header and JSON line are concatenated into
+    # one item so each event costs consumers a single get()/wakeup; both
+    # halves stay newline-framed for downstream parsers.
+    head = f"[{event_type.upper()}] {text}\n".encode() if text else b""
+    body = json_line(packet) if event_type in ["asset", "error", "keepalive"] or payload else b""
+    return [head + body] if head or body else []
+
+def log_dispatch(q, ctx: SessionContext, event_type: str, payload: dict = None, text: str = None):
+    # Worker threads log via a SimpleQueue: only the raw event crosses the
+    # thread boundary; rendering happens in drain_raw_logs on the loop.
+    # (asyncio.Queue.put_nowait is not safe from non-loop threads.)
+    if not q: return
+    if isinstance(q, queue.SimpleQueue):
+        q.put((ctx, event_type, payload, text, time.time()))
         return
+    for line in render_log_event(ctx, event_type, payload, text, time.time()):
+        q.put_nowait(line)
 
-    # Debug Mode: Verbose
-    if text: q.put_nowait(f"[{event_type.upper()}] {text}\n")
-    if event_type in ["asset", "error", "keepalive"] or payload: q.put_nowait(json.dumps(packet) + "\n")
+async def drain_raw_logs(raw_q: "queue.SimpleQueue", log_q: asyncio.Queue):
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await loop.run_in_executor(None, raw_q.get)
+        if item is None: break
+        ctx, event_type, payload, text, ts = item
+        for line in render_log_event(ctx, event_type, payload, text, ts):
+            log_q.put_nowait(line)
 
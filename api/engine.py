@@ -3,43 +3,93 @@ import io
 import os
 import time
 import math
+import re
+import fcntl
+import functools
 import asyncio
 import subprocess
 import threading
+import queue
 import uuid
 import aiohttp
-from typing import List
+from collections import deque
+from typing import Sequence
 from concurrent.futures import ThreadPoolExecutor
-from .core import SessionContext, Cargo, CONFIG, CODEC_MAP, log_dispatch
+from .core import SessionContext, Cargo, CONFIG, CODEC_MAP, log_dispatch, drain_raw_logs
 
 try:
     import av
 except ImportError:
     pass
 
+@functools.lru_cache(maxsize=64)
+def _build_cmd_prefix(chunk_size: str, limit_rate: str, player_clients: str, wait_time: str,
+                      po_token: str, impersonate: str, no_playlist: bool, list_only: bool = False) -> tuple:
+    # Sessions reuse identical settings, so the constant part of the
+    # yt-dlp argv is assembled once per distinct configuration; callers
+    # append the cookie file and URL at spawn time.
+    cmd = [sys.executable, "-m", "yt_dlp", "--newline"]
+    if list_only: cmd.append("--list-formats")
+    else: cmd.extend(["-f", "ba", "-S", "+abr,+tbr,+size", "--http-chunk-size", chunk_size, "--limit-rate", limit_rate, "-o", "-"])
+    if no_playlist: cmd.append("--no-playlist")
+
+    clients_list = [c.strip() for c in player_clients.split(',')] if player_clients else []
+    if "web" not in clients_list: clients_list.append("web")
+    extractor_params = []
+    if clients_list: extractor_params.append(f"player_client={','.join(clients_list)}")
+    if wait_time: extractor_params.append(f"playback_wait={wait_time}")
+    if po_token: extractor_params.append(f"po_token={po_token}")
+    if extractor_params: cmd.extend(["--extractor-args", f"youtube:{';'.join(extractor_params)}"])
+    if impersonate: cmd.extend(["--impersonate", impersonate])
+    return tuple(cmd)
+
+# One C-level scan classifies a stderr line (progress vs error) on raw
+# bytes, replacing separate substring checks and a .lower() copy per line.
+_MINER_CLASS_RE = re.compile(rb'(\[download\])|(?:[Ee][Rr][Rr][Oo][Rr])')
+
 def miner_log_monitor(pipe, q, ctx: SessionContext):
+    # Bulk 64KB reads instead of readline(): one syscall per chunk, not per line.
     if ctx.mode == "data":
-        for _ in iter(pipe.readline, b""): pass
+        while pipe.read(65536): pass
         return
     last_progress_time = 0.0
+    tail = b""
+    fd = pipe.fileno()
     try:
-        for line in iter(pipe.readline, b""):
-            text = line.decode("utf-8", errors="ignore").strip()
-            if not text: continue
-            if "[download]" in text:
-                now = time.time()
-                if (now - last_progress_time) > 1.0:
-                    clean_text = text.replace("[download]", "⛏️").strip()
-                    log_dispatch(q, ctx, "status", text=clean_text)
-                    last_progress_time = now
-            elif "error" in text.lower():
-                log_dispatch(q, ctx, "error", text=f"[MINER ERROR] {text}")
-            else:
-                log_dispatch(q, ctx, "status", text=f"[MINER] {text}")
-    except ValueError: pass 
+        while True:
+            # os.read returns as soon as any bytes arrive; BufferedReader's
+            # read(n) would hold sparse progress lines until 64KB piled up.
+            chunk = os.read(fd, 65536)
+            if not chunk: break
+            tail += chunk
+            lines = tail.split(b"\n")
+            tail = lines.pop()
+            for raw in lines:
+                raw = raw.strip()
+                if not raw: continue
+                m = _MINER_CLASS_RE.search(raw)
+                if m and m.group(1):
+                    now = time.time()
+                    if (now - last_progress_time) > 1.0:
+                        text = raw.decode("utf-8", errors="ignore")
+                        clean_text = text.replace("[download]", "⛏️").strip()
+                        log_dispatch(q, ctx, "status", text=clean_text)
+                        last_progress_time = now
+                elif m:
+                    log_dispatch(q, ctx, "error", text=f"[MINER ERROR] {raw.decode('utf-8', errors='ignore')}")
+                else:
+                    log_dispatch(q, ctx, "status", text=f"[MINER] {raw.decode('utf-8', errors='ignore')}")
+        if tail.strip():
+            log_dispatch(q, ctx, "status", text=f"[MINER] {tail.decode('utf-8', errors='ignore').strip()}")
+    except (OSError, ValueError): pass
 
-def create_package(packets: List, input_stream, max_dur: float, fmt: str):
-    output_mem = io.BytesIO()
+def create_package(packets: Sequence, input_stream, fmt: str):
+    # Muxes every packet it is given; the caller decides the cut. The
+    # summed payload is a lower bound on the container size, so this
+    # reservation is always fully overwritten: one allocation instead of
+    # incremental regrow+memcpy.
+    output_mem = io.BytesIO(bytes(sum(pkt.size for pkt in packets)))
+    output_mem.seek(0)
     with av.open(output_mem, mode="w", format=fmt, options={'strict': 'experimental'}) as container:
         stream = container.add_stream(input_stream.codec_context.name)
         stream.time_base = input_stream.time_base
@@ -47,42 +97,22 @@ def create_package(packets: List, input_stream, max_dur: float, fmt: str):
             stream.codec_context.extradata = input_stream.codec_context.extradata
         base_dts = packets[0].dts
         base_pts = packets[0].pts
-        cutoff_idx = 0
-        for i, pkt in enumerate(packets):
-            rel_time = float(pkt.dts - base_dts) * input_stream.time_base
-            if rel_time < max_dur:
-                pkt.dts -= base_dts
-                pkt.pts -= base_pts
-                pkt.stream = stream
-                container.mux(pkt)
-                cutoff_idx = i
-            else: break
+        for pkt in packets:
+            pkt.dts -= base_dts
+            pkt.pts -= base_pts
+            pkt.stream = stream
+            container.mux(pkt)
     output_mem.seek(0)
     size = round(output_mem.getbuffer().nbytes / 1024 / 1024, 2)
-    return output_mem, cutoff_idx, size
+    return output_mem, size
 
 def run_packager(loop: asyncio.AbstractEventLoop, conveyor_belt: asyncio.Queue, log_q: asyncio.Queue, 
                  ctx: SessionContext, target_url: str, chunk_size: str, limit_rate: str, 
                  player_clients: str, wait_time: str, po_token: str, impersonate: str, 
                  no_playlist: bool, total_duration: float = 0.0, split_duration: int = 30):
     
-    clients_list = [c.strip() for c in player_clients.split(',')] if player_clients else []
-    if "web" not in clients_list: clients_list.append("web")
-    
-    extractor_params = []
-    if clients_list: extractor_params.append(f"player_client={','.join(clients_list)}")
-    if wait_time: extractor_params.append(f"playback_wait={wait_time}")
-    if po_token: extractor_params.append(f"po_token={po_token}")
-    extractor_string = f"youtube:{';'.join(extractor_params)}" if extractor_params else ""
-
-    cmd = [
-        sys.executable, "-m", "yt_dlp", "--newline", "-f", "ba", "-S", "+abr,+tbr,+size",
-        "--http-chunk-size", chunk_size, "--limit-rate", limit_rate, "-o", "-"
-    ]
-    if no_playlist: cmd.append("--no-playlist")
+    cmd = list(_build_cmd_prefix(chunk_size, limit_rate, player_clients, wait_time, po_token, impersonate, no_playlist))
     if os.path.exists(ctx.cookie_file): cmd.extend(["--cookies", ctx.cookie_file])
-    if extractor_string: cmd.extend(["--extractor-args", extractor_string])
-    if impersonate: cmd.extend(["--impersonate", impersonate])
     cmd.append(target_url)
 
     # ==========================================================
@@ -108,7 +138,11 @@ def run_packager(loop: asyncio.AbstractEventLoop, conveyor_belt: asyncio.Queue,
 
     log_dispatch(log_q, ctx, "status", text=f"[PACKAGER] factory start: {target_url}")
     
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=1 << 20)
+    # Grow the kernel pipe from the 64KB default so the demuxer reads
+    # fewer, larger chunks (F_SETPIPE_SZ is Linux-only; best effort).
+    try: fcntl.fcntl(process.stdout.fileno(), 1031, 1 << 20)
+    except OSError: pass
     log_thread = threading.Thread(target=miner_log_monitor, args=(process.stderr, log_q, ctx))
     log_thread.daemon = True
     log_thread.start()
@@ -123,27 +157,47 @@ def run_packager(loop: asyncio.AbstractEventLoop, conveyor_belt: asyncio.Queue,
         mime = f"audio/{out_fmt}"
         log_dispatch(log_q, ctx, "status", text=f"[PACKAGER] ✅ Connected: {codec}/{out_fmt}")
 
-        buffer = []
+        # Precompute both limits in integer DTS ticks so the per-packet
+        # work is plain int compares instead of Fraction arithmetic. The
+        # cutoff (last packet inside the target split) is tracked while
+        # buffering, so sealing never re-walks the buffer to find it.
+        tb = in_stream.time_base
+        threshold_ticks = int(threshold * tb.denominator) // tb.numerator
+        target_ticks = int(target_split * tb.denominator) // tb.numerator
+
+        buffer = deque()
+        base_dts = None
+        cutoff = 0
         box_id = 0
         for packet in in_container.demux(in_stream):
             if packet.dts is None: continue
             buffer.append(packet)
-            curr_dur = float(packet.dts - buffer[0].dts) * in_stream.time_base
-            
+            if base_dts is None: base_dts = packet.dts
+            elif packet.dts - base_dts < target_ticks: cutoff = len(buffer) - 1
+
             # Dynamic Threshold Check
-            if curr_dur >= threshold:
+            if packet.dts - base_dts >= threshold_ticks:
+                curr_dur = float(packet.dts - base_dts) * tb
                 log_dispatch(log_q, ctx, "status", text=f"[PACKAGER] 🎁 Bin full ({curr_dur:.0f}s). Sealing Box #{box_id}...")
-                mem_file, cutoff, size = create_package(buffer, in_stream, target_split, out_fmt)
+                outgoing = [buffer.popleft() for _ in range(cutoff + 1)]
+                mem_file, size = create_package(outgoing, in_stream, out_fmt)
                 cargo = Cargo(mem_file, box_id, mime, size)
-                asyncio.run_coroutine_threadsafe(conveyor_belt.put(cargo), loop)
-                buffer = buffer[cutoff + 1 :]
+                # Blocks the packager when the belt is full: backpressure
+                # instead of unbounded BytesIO pile-up while uploads lag.
+                asyncio.run_coroutine_threadsafe(conveyor_belt.put(cargo), loop).result()
                 box_id += 1
+                # Rebase the short carried-over tail (threshold - target).
+                base_dts = buffer[0].dts if buffer else None
+                cutoff = 0
+                for i, pkt in enumerate(buffer):
+                    if pkt.dts - base_dts < target_ticks: cutoff = i
+                    else: break
 
         if buffer:
             log_dispatch(log_q, ctx, "status", text="[PACKAGER] 🏁 Stream ended. Sealing final box...")
-            mem_file, _, size = create_package(buffer, in_stream, float("inf"), out_fmt)
+            mem_file, size = create_package(list(buffer), in_stream, out_fmt)
             cargo = Cargo(mem_file, box_id, mime, size)
-            asyncio.run_coroutine_threadsafe(conveyor_belt.put(cargo), loop)
+            asyncio.run_coroutine_threadsafe(conveyor_belt.put(cargo), loop).result()
     except Exception as e:
         log_dispatch(log_q, ctx, "error", text=f"[PACKAGER ERROR] 💥 {e}")
     finally:
@@ -161,19 +215,8 @@ def run_packager(loop: asyncio.AbstractEventLoop, conveyor_belt: asyncio.Queue,
 
 def run_format_listing(log_q, ctx, url, cookies_path, player_clients, po_token, impersonate, no_playlist: bool):
     log_dispatch(log_q, ctx, "status", text="--- 📋 LISTING FORMATS ---")
-    cmd = [sys.executable, "-m", "yt_dlp", "--list-formats", "--newline"]
-    if no_playlist: cmd.append("--no-playlist")
+    cmd = list(_build_cmd_prefix("", "", player_clients, "", po_token, impersonate, no_playlist, list_only=True))
     if os.path.exists(cookies_path): cmd.extend(["--cookies", cookies_path])
-    
-    clients_list = [c.strip() for c in player_clients.split(',')] if player_clients else []
-    if "web" not in clients_list: clients_list.append("web")
-    
-    extractor_params = []
-    if clients_list: extractor_params.append(f"player_client={','.join(clients_list)}")
-    if po_token: extractor_params.append(f"po_token={po_token}")
-    if extractor_params: cmd.extend(["--extractor-args", f"youtube:{';'.join(extractor_params)}"])
-    if impersonate: cmd.extend(["--impersonate", impersonate])
-    
     cmd.append(url)
     log_dispatch(log_q, ctx, "status", text=f"[COMMAND] {' '.join(cmd)}")
     
@@ -185,8 +228,16 @@ def run_format_listing(log_q, ctx, url, cookies_path, player_clients, po_token,
         proc.wait()
     except Exception as e: log_dispatch(log_q, ctx, "error", text=f"[LIST ERROR] {e}")
 
+async def _body_gen(buf: io.BytesIO):
+    # Feed the upload in 64KB slices so aiohttp interleaves reads with TCP
+    # sends instead of swallowing the whole chunk at once.
+    buf.seek(0)
+    while True:
+        piece = buf.read(65536)
+        if not piece: return
+        yield piece
+
 async def ship_cargo(session: aiohttp.ClientSession, cargo: Cargo, ctx: SessionContext, log_q: asyncio.Queue):
-    cargo.buffer.seek(0)
     url, headers = "", {}
     if ctx.provider == "assemblyai":
         url = "https://api.assemblyai.com/v2/upload"
@@ -194,9 +245,10 @@ async def ship_cargo(session: aiohttp.ClientSession, cargo: Cargo, ctx: SessionC
     elif ctx.provider == "deepgram":
         url = "https://manage.deepgram.com/storage/assets"
         headers = { "Authorization": f"Token {ctx.deepgram_key}", "Content-Type": cargo.mime_type }
+    headers["Content-Length"] = str(cargo.buffer.getbuffer().nbytes)
 
     try:
-        async with session.post(url, headers=headers, data=cargo.buffer) as resp:
+        async with session.post(url, headers=headers, data=_body_gen(cargo.buffer)) as resp:
             if resp.status >= 400:
                 err = await resp.text()
                 log_dispatch(log_q, ctx, "error", text=f"[SHIPPER] ❌ Upload Failed Box #{cargo.index}: {resp.status} {err}", payload={"error_code": resp.status, "details": err, "box": cargo.index})
@@ -210,15 +262,24 @@ async def ship_cargo(session: aiohttp.ClientSession, cargo: Cargo, ctx: SessionC
 
 async def run_shipper(conveyor_belt: asyncio.Queue, log_q: asyncio.Queue, ctx: SessionContext):
     log_dispatch(log_q, ctx, "status", text=f"[SHIPPER] 🚚 Logistics Partner: {ctx.provider.upper()}")
-    async with aiohttp.ClientSession() as session:
-        active_shipments = []
+    sem = asyncio.Semaphore(CONFIG.UPLOAD_CONCURRENCY)
+    # Keep connections warm between boxes: one TLS handshake + DNS lookup
+    # per provider host, reused for every upload in the session.
+    connector = aiohttp.TCPConnector(limit=8, limit_per_host=8, ttl_dns_cache=300, keepalive_timeout=75)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=10)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def guarded_ship(cargo):
+            async with sem:
+                await ship_cargo(session, cargo, ctx, log_q)
+
+        active_shipments = set()
         while True:
             cargo = await conveyor_belt.get()
             if cargo is None: break
             log_dispatch(log_q, ctx, "status", text=f"[SHIPPER] 🚚 Picked up Box #{cargo.index}. Shipping...")
-            t = asyncio.create_task(ship_cargo(session, cargo, ctx, log_q))
-            active_shipments.append(t)
-            active_shipments = [x for x in active_shipments if not x.done()]
+            t = asyncio.create_task(guarded_ship(cargo))
+            active_shipments.add(t)
+            t.add_done_callback(active_shipments.discard)
         if active_shipments:
             log_dispatch(log_q, ctx, "status", text=f"[SHIPPER] ⏳ Waiting for {len(active_shipments)} active shipments...")
             await asyncio.gather(*active_shipments)
@@ -233,7 +294,7 @@ async def run_fly_process(log_queue: asyncio.Queue, url: str, cookies: str, chun
                           dg_key: str, aai_key: str, only_list_formats: bool = False, no_playlist: bool = False,
                           total_duration: float = 0.0, split_duration: int = 30):
     loop = asyncio.get_running_loop()
-    conveyor_belt = asyncio.Queue()
+    conveyor_belt = asyncio.Queue(maxsize=CONFIG.CONVEYOR_CAPACITY)
     cookie_filename = f"/tmp/cookies_{uuid.uuid4().hex[:8]}.txt"
     if cookies:
         try:
@@ -243,17 +304,23 @@ async def run_fly_process(log_queue: asyncio.Queue, url: str, cookies: str, chun
     ctx = SessionContext(provider.lower(), dg_key or os.environ.get("DEEPGRAM_KEY", ""), aai_key or os.environ.get("ASSEMBLYAI_KEY", ""), mode.lower(), cookie_filename)
     log_dispatch(log_queue, ctx, "status", text="--- 🏭 LOGISTICS SYSTEM STARTED ---")
     hb_task = asyncio.create_task(heartbeat(log_queue))
-    
+
+    # Worker threads log into a SimpleQueue; this task renders + forwards.
+    raw_log_q = queue.SimpleQueue()
+    drain_task = asyncio.create_task(drain_raw_logs(raw_log_q, log_queue))
+
     with ThreadPoolExecutor(max_workers=1) as pool:
         if only_list_formats:
-            await loop.run_in_executor(pool, run_format_listing, log_queue, ctx, url, cookie_filename, player_clients, po_token, impersonate, no_playlist)
+            await loop.run_in_executor(pool, run_format_listing, raw_log_q, ctx, url, cookie_filename, player_clients, po_token, impersonate, no_playlist)
             log_dispatch(log_queue, ctx, "status", text="--- ✅ DONE ---")
         else:
             shipper_task = asyncio.create_task(run_shipper(conveyor_belt, log_queue, ctx))
-            await loop.run_in_executor(pool, run_packager, loop, conveyor_belt, log_queue, ctx, url, chunk_size, limit_rate, player_clients, wait_time, po_token, impersonate, no_playlist, total_duration, split_duration)
+            await loop.run_in_executor(pool, run_packager, loop, conveyor_belt, raw_log_q, ctx, url, chunk_size, limit_rate, player_clients, wait_time, po_token, impersonate, no_playlist, total_duration, split_duration)
             await shipper_task
             log_dispatch(log_queue, ctx, "status", text="--- ✅ ALL SHIPMENTS COMPLETE ---")
-    
+
+    raw_log_q.put(None)
+    await drain_task
     hb_task.cancel()
     if os.path.exists(cookie_filename): os.remove(cookie_filename)
     log_queue.put_nowait(None)
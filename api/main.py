@@ -1,11 +1,18 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import os
-import subprocess
+import pwd
+import re
 import asyncio
+import hashlib
+import shlex
+import signal
+import stat
+import time
+from functools import lru_cache
 from typing import Optional
 from . import core
 from . import engine
@@ -15,19 +22,30 @@ from . import engine
 # ========================================================
 core.setup_environment()
 
-av_status = "Initializing..."
+@lru_cache(maxsize=1)
+def get_av_status() -> str:
+    # codecs_available wraps every FFmpeg codec descriptor in a Python
+    # object; only the stats tab needs the count, so pay it on first use.
+    try:
+        import av
+        return f"✅ PyAV {av.__version__} | Codecs: {len(av.codecs_available)}"
+    except Exception as e:
+        return f"❌ PyAV Error: {e}"
+
+# orjson renders listing payloads several times faster than stdlib json;
+# fall back to the default JSONResponse when it isn't installed.
 try:
-    import av
-    av_status = f"✅ PyAV {av.__version__} | Codecs: {len(av.codecs_available)}"
-except Exception as e:
-    av_status = f"❌ PyAV Error: {e}"
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as _JSONResponseClass
+except ImportError:
+    from fastapi.responses import JSONResponse as _JSONResponseClass
 
-app = FastAPI()
+app = FastAPI(default_response_class=_JSONResponseClass)
 
 # Mount Static Files (CSS, JS)
-static_dir = os.path.join(os.path.dirname(__file__), "static")
-if os.path.exists(static_dir):
-    app.mount("/static", StaticFiles(directory=static_dir), name="static")
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
+if os.path.exists(STATIC_DIR):
+    app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 app.add_middleware(
     CORSMiddleware,
@@ -40,15 +58,27 @@ app.add_middleware(
 # ========================================================
 # 2. UI ROUTE
 # ========================================================
-@app.get("/", response_class=HTMLResponse)
-def index():
-    index_path = os.path.join(os.path.dirname(__file__), "static", "index.html")
-    if not os.path.exists(index_path): return HTMLResponse("<h1>Error: static/index.html not found</h1>", status_code=500)
+def _render_index():
+    # Everything interpolated into the page (project root) is fixed for
+    # the process lifetime, so render + encode once at import.
+    index_path = os.path.join(STATIC_DIR, "index.html")
+    if not os.path.exists(index_path): return None
     with open(index_path, "r", encoding="utf-8") as f: content = f.read()
-    
     config_script = f"""<script>window.SERVER_CONFIG = {{ "projectRoot": "{core.paths['root']}" }};</script>"""
     final_html = content.replace('<script src="/static/app.js"></script>', f'{config_script}\n<script src="/static/app.js"></script>')
-    return HTMLResponse(content=final_html)
+    return final_html.encode("utf-8")
+
+_INDEX_BYTES = _render_index()
+# The page is immutable for the process lifetime, so its ETag is too.
+_INDEX_ETAG = f'"{hashlib.blake2b(_INDEX_BYTES, digest_size=8).hexdigest()}"' if _INDEX_BYTES else None
+_INDEX_HEADERS = {"ETag": _INDEX_ETAG, "Cache-Control": "no-cache"} if _INDEX_ETAG else {}
+
+@app.get("/", response_class=HTMLResponse)
+def index(request: Request):
+    if _INDEX_BYTES is None: return HTMLResponse("<h1>Error: static/index.html not found</h1>", status_code=500)
+    if request.headers.get("if-none-match") == _INDEX_ETAG:
+        return Response(status_code=304, headers=_INDEX_HEADERS)
+    return HTMLResponse(content=_INDEX_BYTES, headers=_INDEX_HEADERS)
 
 # ========================================================
 # 3. API ENDPOINTS
@@ -89,67 +119,236 @@ async def fly_process(payload: FlyRequest):
             yield data
     return StreamingResponse(log_generator(), media_type="text/plain")
 
+# O(1) text-preview classification; extensionless files stay previewable
+# because the /api/view NUL sniff is the final arbiter for those.
+_TEXT_EXTS = frozenset({
+    '.py', '.js', '.json', '.txt', '.html', '.css', '.md', '.env', '.yml',
+    '.yaml', '.sh', '.log', '.ini', '.cfg', '.toml', '.xml', '.csv'
+})
+
+# Listings are a pure function of directory mtime (plus a short TTL to
+# bound staleness of per-file sizes); repeat visits cost one stat.
+_LIST_CACHE = {}
+_LIST_CACHE_MAX = 256
+_LIST_CACHE_TTL = 5.0
+
+def _safe_meta(e):
+    # The loop's only fallible syscalls, behind one try/except compiled
+    # once; a DirEntry the kernel just enumerated rarely fails to stat.
+    try:
+        is_dir = e.is_dir(follow_symlinks=False)
+        return is_dir, None if is_dir else e.stat(follow_symlinks=False)
+    except OSError: return None
+
+def _scan_dir(path: str):
+    # DirEntry caches type and stat from the scandir pass; classify and
+    # size each entry from that instead of re-stat'ing via e.path.
+    items = []
+    # Partition while scanning, then sort each bucket on the bare
+    # lowercased name: comparisons stop paying for the (not is_dir, ...)
+    # tuple the old combined sort rebuilt per element.
+    dirs, files = [], []
+    with os.scandir(path) as entries:
+        for e in entries:
+            meta = _safe_meta(e)
+            if meta is not None: (dirs if meta[0] else files).append((e, meta[0], meta[1]))
+    dirs.sort(key=lambda t: t[0].name.lower())
+    files.sort(key=lambda t: t[0].name.lower())
+    for e, is_dir, st in dirs + files:
+        # One rfind over the basename beats splitext (which re-derives
+        # separators and slices twice) in this per-entry loop.
+        dot = e.name.rfind('.')
+        ext = e.name[dot:].lower() if not is_dir and dot > 0 else ""
+        items.append({
+            "name": e.name, "path": e.path, "is_dir": is_dir,
+            "size": "-" if is_dir else core.get_human_size(st.st_size),
+            "ext": ext,
+            "is_text": not is_dir and (ext in _TEXT_EXTS or ext == "")
+        })
+    return items
+
 @app.get("/api/list")
-def list_files(path: str = "/", source: str = "runtime"):
+async def list_files(request: Request, path: str = "/", source: str = "runtime"):
     if source == "runtime": path = os.path.abspath(path)
     if source == "build":
         lookup_path = path.rstrip('/') if len(path) > 1 and path.endswith('/') else path
-        items = core.BUILD_FS_CACHE.get(lookup_path, [])
+        items = core.get_build_fs_cache().get(lookup_path, [])
         return {"current_path": path, "items": items, "source": "build"}
 
-    if not os.path.exists(path): raise HTTPException(404, "Path not found")
-    items = []
+    try: dir_mtime = (await asyncio.to_thread(os.stat, path)).st_mtime_ns
+    except OSError: raise HTTPException(404, "Path not found")
+
+    # Weak ETag over (path, mtime): a 304 skips the whole scandir pass
+    # and sends nothing over the wire.
+    etag = f'W/"{hashlib.blake2b(f"{path}:{dir_mtime}".encode(), digest_size=8).hexdigest()}"'
+    list_headers = {"ETag": etag, "Cache-Control": "private, must-revalidate"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=list_headers)
+
+    cache_key = (path, dir_mtime)
+    hit = _LIST_CACHE.get(cache_key)
+    if hit and (time.time() - hit[0]) < _LIST_CACHE_TTL:
+        return _JSONResponseClass(hit[1], headers=list_headers)
     try:
-        with os.scandir(path) as entries:
-            for e in sorted(entries, key=lambda x: (not x.is_dir(), x.name.lower())):
-                try:
-                    items.append({
-                        "name": e.name, "path": e.path, "is_dir": e.is_dir(),
-                        "size": core.get_size_str(e.path) if not e.is_dir() else "-",
-                        "ext": os.path.splitext(e.name)[1].lower() if not e.is_dir() else ""
-                    })
-                except: continue
-        return {"current_path": path, "items": items, "source": "runtime"}
+        items = await asyncio.to_thread(_scan_dir, path)
+        resp = {"current_path": path, "items": items, "source": "runtime"}
+        if len(_LIST_CACHE) >= _LIST_CACHE_MAX: _LIST_CACHE.pop(next(iter(_LIST_CACHE)))
+        _LIST_CACHE[cache_key] = (time.time(), resp)
+        return _JSONResponseClass(resp, headers=list_headers)
     except Exception as e: raise HTTPException(403, str(e))
 
+# Anything the shell would interpret (pipes, redirects, expansion, quoting
+# edge cases we don't replicate) falls back to /bin/sh; plain `ls -la`-style
+# commands exec directly and skip the intermediate shell fork.
+_SHELL_META = re.compile(r'[|&;<>$`*?()\[\]{}~\n\\]')
+
+# Bare commands the terminal UI issues constantly; answering them
+# in-process skips the fork+exec entirely. Anything with arguments
+# falls through to the real binary.
+_FAST_CMDS = {
+    "pwd": lambda: core.paths["root"],
+    "whoami": lambda: pwd.getpwuid(os.getuid()).pw_name,
+    "ls": lambda: "\n".join(sorted(os.listdir(core.paths["root"]))),
+}
+
 @app.get("/api/shell")
-def run_shell(cmd: str):
+async def run_shell(cmd: str):
     if not cmd: return {"out": ""}
+    fast = _FAST_CMDS.get(cmd.strip())
+    if fast:
+        try: return {"out": fast()}
+        except Exception as e: return {"out": str(e)}
+    # First shell command makes bundled binaries executable; cached no-op after.
+    await asyncio.to_thread(core.ensure_bin_executable)
     try:
-        res = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=10, cwd=core.paths["root"], env=os.environ)
-        return {"out": res.stdout}
-    except subprocess.TimeoutExpired: return {"out": "⚠️ Command timed out."}
+        # env is omitted on purpose: the child inherits our environment
+        # directly instead of materializing a full copy per invocation.
+        # start_new_session gives the child its own process group so a
+        # timeout kill also reaches grandchildren of a shell pipeline.
+        # close_fds=False skips the descriptor-closing sweep at spawn; safe
+        # since PEP 446 made Python-created fds non-inheritable anyway.
+        common = dict(stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+                      cwd=core.paths["root"], start_new_session=True, close_fds=False)
+        args = None
+        if not _SHELL_META.search(cmd):
+            try: args = shlex.split(cmd)
+            except ValueError: args = None
+            # FOO=1 cmd is shell syntax, not an executable named "FOO=1".
+            if args and '=' in args[0]: args = None
+        proc = None
+        if args:
+            # Builtins (cd, export) and other not-a-binary tokens raise
+            # here; the shell path below handles them like the baseline did.
+            try: proc = await asyncio.create_subprocess_exec(*args, **common)
+            except FileNotFoundError: pass
+        if proc is None: proc = await asyncio.create_subprocess_shell(cmd, **common)
+        try:
+            out, _ = await asyncio.wait_for(proc.communicate(), timeout=10)
+        except asyncio.TimeoutError:
+            try: os.killpg(proc.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError): proc.kill()
+            return {"out": "⚠️ Command timed out."}
+        return {"out": out.decode("utf-8", errors="replace")}
     except Exception as e: return {"out": str(e)}
 
+# The storage walks are the expensive part and their inputs barely move
+# between polls; serve a cached snapshot for 30s (?refresh=1 bypasses).
+_STATS_CACHE = {"t": 0.0, "v": None}
+_STATS_TTL = 30.0
+
 @app.get("/api/stats")
-def stats_endpoint():
-    stats = []
+async def stats_endpoint(refresh: bool = False):
+    if not refresh and _STATS_CACHE["v"] is not None and (time.monotonic() - _STATS_CACHE["t"]) < _STATS_TTL:
+        return _STATS_CACHE["v"]
     locations = [("App Code", core.paths["root"]), ("Dependencies", core.paths["vendor"]), ("Binaries", core.paths["bin"]), ("Temp", "/tmp")]
-    for label, path in locations:
-        if os.path.exists(path): stats.append({"label": label, "path": path, "size": core.get_size_str(path)})
-    return {
-        "storage": stats, "av": av_status, "runtime": core.get_runtime_env_info(),
-        "tools": core.compare_tools(), "inodes": core.get_python_inodes(), "has_build_index": bool(core.BUILD_FS_CACHE)
+    present = [(label, path) for label, path in locations if os.path.exists(path)]
+    # Every sizing is a blocking tree walk; gather runs them (plus the
+    # small metadata reads) concurrently off the event loop.
+    sizes, av, runtime_info, tools, inodes = await asyncio.gather(
+        asyncio.gather(*[asyncio.to_thread(core.get_size_str, p) for _, p in present]),
+        asyncio.to_thread(get_av_status),
+        asyncio.to_thread(core.get_runtime_env_info),
+        asyncio.to_thread(core.compare_tools),
+        asyncio.to_thread(core.get_python_inodes),
+    )
+    stats = [{"label": label, "path": path, "size": size} for (label, path), size in zip(present, sizes)]
+    result = {
+        "storage": stats, "av": av, "runtime": runtime_info,
+        "tools": tools, "inodes": inodes, "has_build_index": os.path.exists(core.paths["build_index"])
     }
+    _STATS_CACHE["v"] = result
+    _STATS_CACHE["t"] = time.monotonic()
+    return result
+
+_VIEW_CAP = 500_000
+_VIEW_CHUNK = 16384
 
 @app.get("/api/view")
-def view_file(path: str):
-    if not os.path.exists(path): return {"error": "File not found"}
+async def view_file(request: Request, path: str):
+    # Same weak-ETag scheme as /api/list: re-opening an unchanged file
+    # from the modal costs one stat and a 304 instead of a re-stream.
+    view_headers = {}
     try:
-        if os.path.getsize(path) > 500_000: return {"error": "File too large"}
-        with open(path, 'rb') as f:
-            if b'\x00' in f.read(1024): return {"error": "Binary file"}
-        with open(path, 'r', encoding='utf-8', errors='replace') as f: return {"content": f.read()}
-    except Exception as e: return {"error": str(e)}
+        mtime = (await asyncio.to_thread(os.stat, path)).st_mtime_ns
+        etag = f'W/"{hashlib.blake2b(f"{path}:{mtime}".encode(), digest_size=8).hexdigest()}"'
+        view_headers = {"ETag": etag, "Cache-Control": "private, must-revalidate"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=view_headers)
+    except OSError: pass
+
+    # Streamed as text/plain in 16KB slices: the sniff runs on the first
+    # chunk only and the full preview never sits in memory at once.
+    def gen():
+        try: fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+        except FileNotFoundError: yield b"File not found"; return
+        except OSError as e: yield str(e).encode(); return
+        try:
+            if os.fstat(fd).st_size > _VIEW_CAP: yield b"File too large"; return
+            first = os.pread(fd, _VIEW_CHUNK, 0)
+            # Bounded find avoids materializing a 1KB slice just to scan it.
+            if first.find(b'\x00', 0, 1024) != -1: yield b"Binary file"; return
+            yield first
+            offset = len(first)
+            while offset < _VIEW_CAP:
+                chunk = os.pread(fd, min(_VIEW_CHUNK, _VIEW_CAP - offset), offset)
+                if not chunk: break
+                yield chunk
+                offset += len(chunk)
+        except OSError as e: yield str(e).encode()
+        finally: os.close(fd)
+    return StreamingResponse(gen(), media_type="text/plain; charset=utf-8", headers=view_headers)
+
+def _delete_path(path: str):
+    # One lstat picks the branch: os.path.isdir would stat a second time
+    # and follow symlinks, sending a link-to-directory down rmdir.
+    if stat.S_ISDIR(os.lstat(path).st_mode): os.rmdir(path)
+    else: os.remove(path)
+
+def _invalidate_after_delete(path: str):
+    # The listing cache is mtime-keyed, but the parent's stale snapshots
+    # would linger until FIFO eviction (or serve within the TTL on coarse
+    # mtime filesystems); drop them outright, and let the next stats poll
+    # re-walk storage instead of reporting the deleted bytes for 30s.
+    parent = os.path.dirname(path) or "/"
+    for key in [k for k in _LIST_CACHE if k[0] == parent]: _LIST_CACHE.pop(key, None)
+    _STATS_CACHE["v"] = None
 
 @app.get("/api/delete")
-def delete_file(path: str):
+async def delete_file(path: str):
     try:
-        if os.path.isdir(path): os.rmdir(path)
-        else: os.remove(path)
+        await asyncio.to_thread(_delete_path, path)
+        _invalidate_after_delete(path)
         return {"ok": True}
     except Exception as e: return {"error": str(e)}
 
 @app.get("/api/download")
-def download(path: str):
-    if os.path.exists(path): return FileResponse(path, filename=os.path.basename(path))
+async def download(path: str):
+    # Passing stat_result lets Starlette skip its own stat and emit
+    # Content-Length/Last-Modified without re-touching the inode.
+    try: st = await asyncio.to_thread(os.stat, path)
+    except OSError: return
+    resp = FileResponse(path, filename=os.path.basename(path), stat_result=st)
+    # 1MB reads instead of Starlette's 64KB default: 16x fewer
+    # read+await round-trips per megabyte on vendor-sized binaries.
+    resp.chunk_size = 1 << 20
+    return resp
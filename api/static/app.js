@@ -1,14 +1,18 @@
 let currentPath = window.SERVER_CONFIG.projectRoot;
 let currentSource = 'runtime';
 
-// Tabs
+// Tabs — track the active elements instead of rescanning every node to
+// strip classes on each switch.
+let activeView = document.querySelector('.view.active');
+let activeBtn = document.querySelector('.nav-btn.active');
 function switchTab(id) {
-    document.querySelectorAll('.view').forEach(el => el.classList.remove('active'));
-    document.querySelectorAll('.nav-btn').forEach(el => el.classList.remove('active'));
-    
-    document.getElementById(id).classList.add('active');
-    const btn = Array.from(document.querySelectorAll('.nav-btn')).find(b => b.getAttribute('onclick').includes(id));
-    if(btn) btn.classList.add('active');
+    if (activeView) activeView.classList.remove('active');
+    if (activeBtn) activeBtn.classList.remove('active');
+
+    activeView = document.getElementById(id);
+    activeView.classList.add('active');
+    activeBtn = Array.from(document.querySelectorAll('.nav-btn')).find(b => b.getAttribute('onclick').includes(id)) || null;
+    if(activeBtn) activeBtn.classList.add('active');
 }
 
 function setMode(mode) {
@@ -26,6 +30,8 @@ function setMode(mode) {
     refresh();
 }
 
+const esc = s => String(s).replace(/&/g, '&amp;').replace(/"/g, '&quot;').replace(/</g, '&lt;');
+
 async function nav(path) {
     currentPath = path;
     document.getElementById('addr').value = path;
@@ -43,39 +49,47 @@ async function nav(path) {
             return;
         }
 
-        data.items.forEach(item => {
-            const tr = document.createElement('tr');
-            tr.className = 'item-row';
+        // One innerHTML assignment = one parse + one reflow, instead of a
+        // DOM append (and style recalc) per row. Clicks are handled by the
+        // delegated listener below via data-* attributes.
+        tbody.innerHTML = data.items.map(item => {
             const icon = item.is_dir ? '📁' : '📄';
-            
-            // Action Buttons
             let actions = '';
             if (!item.is_dir && currentSource === 'runtime') {
-                actions += `<button class="btn" style="padding:2px 6px; margin-right:5px" onclick="event.stopPropagation(); window.open('/api/download?path=${encodeURIComponent(item.path)}')">⬇</button>`;
-                actions += `<button class="btn" style="padding:2px 6px; color:var(--danger)" onclick="del(event, '${item.path}')">✕</button>`;
+                actions = `<button class="btn" style="padding:2px 6px; margin-right:5px" data-act="dl">⬇</button>` +
+                          `<button class="btn" style="padding:2px 6px; color:var(--danger)" data-act="del">✕</button>`;
             } else if (!item.is_dir && currentSource === 'build') {
                 actions = '<span class="text-muted" style="font-size:11px">Read Only</span>';
             }
-
-            tr.innerHTML = `
-                <td><span class="icon">${icon}</span> ${item.name}</td>
+            return `<tr class="item-row" data-path="${esc(item.path)}" data-dir="${item.is_dir ? 1 : 0}" data-text="${item.is_text === false ? 0 : 1}">
+                <td><span class="icon">${icon}</span> ${esc(item.name)}</td>
                 <td style="font-family:var(--mono); color:var(--text-muted)">${item.size}</td>
-                <td><span class="tag">${item.ext || 'DIR'}</span></td>
+                <td><span class="tag">${esc(item.ext || 'DIR')}</span></td>
                 <td style="text-align:right">${actions}</td>
-            `;
-            tr.onclick = (e) => {
-                if(e.target.tagName === 'BUTTON') return;
-                if (item.is_dir) nav(item.path);
-                else if (currentSource === 'runtime') viewFile(item.path);
-                else alert("Build snapshot files cannot be viewed directly via API.");
-            };
-            tbody.appendChild(tr);
-        });
+            </tr>`;
+        }).join('');
     } catch(e) {
         tbody.innerHTML = `<tr><td colspan="4" class="text-danger" style="text-align:center; padding: 20px;">Error: ${e}</td></tr>`;
     }
 }
 
+// Single delegated handler for every row/button in the file table.
+document.getElementById('file-list').addEventListener('click', (e) => {
+    const tr = e.target.closest('tr.item-row');
+    if (!tr) return;
+    const path = tr.dataset.path;
+    const btn = e.target.closest('button');
+    if (btn) {
+        if (btn.dataset.act === 'dl') window.open(`/api/download?path=${encodeURIComponent(path)}`);
+        else if (btn.dataset.act === 'del') del(e, path);
+        return;
+    }
+    if (tr.dataset.dir === '1') nav(path);
+    else if (currentSource !== 'runtime') alert("Build snapshot files cannot be viewed directly via API.");
+    else if (tr.dataset.text === '0') alert("Binary file — use download instead.");
+    else viewFile(path);
+});
+
 function upDir() {
     const parts = currentPath.split('/').filter(p => p);
     parts.pop();
@@ -87,9 +101,9 @@ function refresh() { nav(currentPath); }
 // File Viewing
 async function viewFile(path) {
     const res = await fetch(`/api/view?path=${encodeURIComponent(path)}`);
-    const data = await res.json();
+    const text = await res.text();
     document.getElementById('modal-title').innerText = path.split('/').pop();
-    document.getElementById('modal-text').innerText = data.content || data.error;
+    document.getElementById('modal-text').innerText = text;
     document.getElementById('file-modal').style.display = 'flex';
 }
 function closeModal() { document.getElementById('file-modal').style.display = 'none'; }
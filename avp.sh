@@ -78,7 +78,7 @@ fi
 
 # --- 5. Python Dependencies: Core ---
 echo "📦 Forcing installation of core Python requirements with no cache..."
-pip install --no-cache-dir fastapi uvicorn yt-dlp[default] aiohttp > /dev/null
+pip install --no-cache-dir fastapi uvicorn yt-dlp[default] aiohttp orjson > /dev/null
 
 # --- 6. Python Dependencies: Custom AV ---
 echo "⬇️  Downloading Custom AV Zip..."